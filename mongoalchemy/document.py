@@ -503,6 +503,8 @@ class Document(object):
         name_reverse = {}
         for name, field in cls.get_fields().items():
             name_reverse[field.db_field] = name
+        if fields is not None:
+            normalized_fields = cls.__normalize(fields)
         # Unwrap
         params = {}
         for k, v in obj.items():
@@ -518,7 +520,6 @@ class Document(object):
             if field.has_autoload:
                 extra_unwrap['session'] = session
             if field_is_doc:
-                normalized_fields = cls.__normalize(fields)
                 unwrapped = field.unwrap(v, fields=normalized_fields.get(k), **extra_unwrap)
             else:
                 unwrapped = field.unwrap(v, **extra_unwrap)
@@ -682,12 +683,6 @@ class Index(object):
             :param collection: the ``pymongo`` collection to ensure this index \
                     is on
         '''
-        components = []
-        for c in self.components:
-            if isinstance(c[0], Field):
-                c = (c[0].db_field, c[1])
-            components.append(c)
-
         extras = {}
         if self.__min is not None:
             extras['min'] = self.__min
@@ -698,10 +693,38 @@ class Index(object):
         if self.__expire_after is not None:
             extras['expireAfterSeconds'] = self.__expire_after
 
-        collection.ensure_index(components, unique=self.__unique,
+        collection.ensure_index(self.__components(), unique=self.__unique,
             drop_dups=self.__drop_dups, **extras)
         return self
 
+    def index_model(self):
+        ''' Returns a ``pymongo`` ``IndexModel`` for this index, so that
+            several indexes can be passed to ``create_indexes`` at once.
+            Requires pymongo 3.0+.
+        '''
+        from pymongo.operations import IndexModel
+        options = {}
+        # drop_dups can't be set on the pymongo versions this is used with
+        if self.__unique:
+            options['unique'] = True
+        if self.__min is not None:
+            options['min'] = self.__min
+        if self.__max is not None:
+            options['max'] = self.__max
+        if self.__bucket_size is not None:
+            options['bucketSize'] = self.__bucket_size
+        if self.__expire_after is not None:
+            options['expireAfterSeconds'] = self.__expire_after
+        return IndexModel(self.__components(), **options)
+
+    def __components(self):
+        components = []
+        for c in self.components:
+            if isinstance(c[0], Field):
+                c = (c[0].db_field, c[1])
+            components.append(c)
+        return components
+
 class Value(object):
     def __init__(self, field, document, from_db=False, extra=False,
                  retrieved=True):
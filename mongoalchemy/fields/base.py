@@ -136,6 +136,8 @@ class Field(object):
 
     no_real_attributes = False  # used for free-form queries.
 
+    __query_field = None
+
     __metaclass__ = FieldMeta
 
     valid_modifiers = SCALAR_MODIFIERS
@@ -228,9 +230,18 @@ class Field(object):
         return schema
 
 
+    def _query_field(self):
+        ''' The :class:`~mongoalchemy.query_expression.QueryField` returned
+            when this field is accessed on its document class.  It is built
+            once and shared, so the field's sub-field and name caches last
+            between queries. '''
+        if self.__query_field is None:
+            self.__query_field = QueryField(self)
+        return self.__query_field
+
     def __get__(self, instance, owner):
         if instance is None:
-            return QueryField(self)
+            return self._query_field()
         obj_value = instance._values[self._name]
 
         # if the value is set, just return it
@@ -319,6 +330,7 @@ class Field(object):
 
     def _set_name(self, name):
         self._name = name
+        self.__query_field = None
 
     def _set_parent(self, parent):
         self.parent = parent
@@ -511,7 +511,7 @@ class ComputedField(Field):
     def __get__(self, instance, owner):
         # class method
         if instance is None:
-            return QueryField(self)
+            return self._query_field()
 
         obj_value = instance._values[self._name]
         if obj_value.set and self.one_time:
@@ -650,7 +650,7 @@ class ModifiedField(DateTimeField):
     def __get__(self, instance, owner):
         # class method
         if instance is None:
-            return QueryField(self)
+            return self._query_field()
 
         obj_value = instance._values[self._name]
         if obj_value.set:
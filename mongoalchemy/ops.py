@@ -19,7 +19,7 @@ class Operation(object):
 
     @property
     def collection(self):
-        return self.session.db[self.type.get_collection_name()]
+        return self.session._get_collection(self.type.get_collection_name())
 
     def ensure_indexes(self):
         self.session.auto_ensure_indexes(self.type)
@@ -31,6 +31,8 @@ class ClearCollectionOp(Operation):
         self.type = kind
     def execute(self):
         self.collection.remove()
+        # indexes are ensured again the next time the type is used
+        self.session.ensured_types.discard(self.type)
 
 class UpdateDocumentOp(Operation):
     def __init__(self, trans_id, session, document, safe, id_expression=None, upsert=False, update_ops={}, **kwargs):
@@ -42,7 +44,7 @@ class UpdateDocumentOp(Operation):
         self.upsert = upsert
 
         if id_expression:
-            self.db_key = Query(self.type, session).filter(id_expression).query
+            self.db_key = Query(self.type, session).filter(id_expression)._get_query()
         elif document.has_id():
             self.db_key = {'_id' : document.mongo_id}
         else:
@@ -73,7 +75,7 @@ class UpdateOp(Operation):
         self.trans_id = trans_id
         self.type = kind
         self.safe = safe
-        self.query = update_obj.query.query
+        self.query = update_obj.query._get_query()
         self.update_data = update_obj.update_data
         self.upsert = update_obj._get_upsert()
         self.multi = update_obj._get_multi()
@@ -129,12 +131,10 @@ class RemoveDocumentOp(Operation):
     def execute(self):
         if self.id is None:
             return
-        db = self.session.db
         self.ensure_indexes()
 
-        collection = db[self.type.get_collection_name()]
         kwargs = safe_args(self.safe)
-        return collection.remove(self.id, **kwargs)
+        return self.collection.remove(self.id, **kwargs)
 
 def safe_args(safe):
     kwargs = {}
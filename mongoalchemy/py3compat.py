@@ -30,16 +30,31 @@ if PYTHON_3: # pragma: no cover
     unicode = str
     basestring = str
     long = int
+    from sys import intern as _intern
+else: # pragma: no cover
+    _intern = intern
 
 def izip(*its): # pragma: no cover
     if 'izip' in dir(itertools):
         return itertools.izip(*its)
     return zip(*its)
 
-def next(it): # pragma: no cover
-    if hasattr(it, '__next__'):
-        return it.__next__()
-    return it.next()
+def next(it, *default): # pragma: no cover
+    try:
+        if hasattr(it, '__next__'):
+            return it.__next__()
+        return it.next()
+    except StopIteration:
+        if default:
+            return default[0]
+        raise
+
+def intern_name(name): # pragma: no cover
+    ''' Intern a field name so equal names share one string object.  Python
+        2 can only intern byte strings, so anything else is returned as is. '''
+    if isinstance(name, str):
+        return _intern(name)
+    return name
 
 def add_metaclass(metaclass): # pragma: no cover
     """ Class decorator for creating a class with a metaclass.
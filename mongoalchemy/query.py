@@ -25,13 +25,23 @@ from mongoalchemy.py3compat import *
 
 from functools import wraps
 from pymongo import ASCENDING, DESCENDING
-from copy import copy, deepcopy
 
 from mongoalchemy.exceptions import BadValueException, BadResultException
-from mongoalchemy.query_expression import QueryExpression, BadQueryException, flatten, FreeFormDoc
+from mongoalchemy.query_expression import (BadQueryException, flatten,
+                                            FreeFormDoc, _or_clauses, _MISSING)
 from mongoalchemy.update_expression import UpdateExpression, FindAndModifyExpression
 from mongoalchemy.util import resolve_name
 
+def _copy_query(value):
+    ''' Copy the dicts and lists of a query document.  Everything else
+        (query fields and wrapped values) is shared, since queries never
+        modify them in place. '''
+    if isinstance(value, dict):
+        return dict((k, _copy_query(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_copy_query(v) for v in value]
+    return value
+
 
 class Query(object):
     ''' A query object has all of the methods necessary to programmatically
@@ -41,6 +51,15 @@ class Query(object):
         In general a query object should be created via ``Session.query``,
         not directly.
     '''
+    __slots__ = ('session', 'type',
+                 '__query', '__flat_query',
+                 '_sort', '_sort_names',
+                 '_fields', '__fields_expr', '__field_names',
+                 'hints', '_hint_names',
+                 '_limit', '_skip', '_batch_size',
+                 '_raw_output', '_no_cache',
+                 '__compiled')
+
     def __init__(self, type, session, exclude_subclasses=False):
         ''' :param type: A subclass of class:`mongoalchemy.document.Document`
             :param db: The :class:`~mongoalchemy.session.Session` which this query is associated with.
@@ -51,12 +70,20 @@ class Query(object):
         self.type = type
 
         self.__query = type.base_query(exclude_subclasses)
+        self.__flat_query = None
         self._sort = []
+        self._sort_names = set()
         self._fields = None
+        self.__fields_expr = None
+        self.__field_names = None
         self.hints = []
+        self._hint_names = set()
         self._limit = None
         self._skip = None
+        self._batch_size = None
         self._raw_output = False
+        self._no_cache = False
+        self.__compiled = None
 
     def __iter__(self):
         return self.__get_query_result()
@@ -64,11 +91,19 @@ class Query(object):
     @property
     def query(self):
         """ The mongo query object which would be executed if this Query
-            object were used """
-        return flatten(self.__query)
+            object were used.  A copy is returned, so it can be modified. """
+        return _copy_query(self._get_query())
+
+    def _get_query(self):
+        ''' The flattened query, cached until the query is next filtered.
+            It shares nested dicts with query expressions, compiled queries
+            and queued operations, so it must not be modified. '''
+        if self.__flat_query is None:
+            self.__flat_query = flatten(self.__query)
+        return self.__flat_query
 
     def __get_query_result(self):
-        return self.session.execute_query(self, self.session)
+        return self.session.execute_query(self)
 
     def raw_output(self):
         """ Turns on raw output, meaning that the MongoAlchemy ORM layer is
@@ -77,23 +112,72 @@ class Query(object):
             back
         """
         self._raw_output = True
+        self.__compiled = None
+        return self
+
+    def no_cache(self):
+        """ Don't add the documents returned by this query to the session's
+            cache.  Useful to keep memory use down when scanning through a
+            large number of documents
+        """
+        self._no_cache = True
+        self.__compiled = None
         return self
 
+    def iterator(self):
+        """ Execute the query and return an iterator over the results which
+            skips the session's cache, as with :func:`no_cache`.  The query
+            itself is not changed.
+        """
+        return self._compiled()._replace(no_cache=True)()
+
+    def as_pymongo(self):
+        """ Alias for :func:`raw_output`.  The results are the documents
+            returned by pymongo, which is much faster than building python
+            objects when the ORM layer isn't needed
+        """
+        return self.raw_output()
+
+    def values(self, *fields):
+        """ Return raw documents containing only ``fields`` (plus the
+            ``_id``).  Shortcut for ``query.fields(*fields).raw_output()``
+
+            :param fields: Instances of :class:``mongoalchemy.query.QueryField`` \
+                specifying which fields to return
+        """
+        if fields:
+            self.fields(*fields)
+        return self.raw_output()
+
     def _get_fields(self):
         return self._fields
 
+    def _get_field_names(self):
+        ''' The names of the fields to retrieve, as given to
+            :func:`~mongoalchemy.document.Document.unwrap`.  Computed once
+            rather than for every document returned. '''
+        if self._fields is None:
+            return None
+        if self.__field_names is None:
+            self.__field_names = frozenset(str(f) for f in self._fields)
+        return self.__field_names
+
     def _get_limit(self):
         return self._limit
 
     def _get_skip(self):
         return self._skip
 
+    def _get_batch_size(self):
+        return self._batch_size
+
     def limit(self, limit):
         ''' Sets the limit on the number of documents returned
 
             :param limit: the number of documents to return
         '''
         self._limit = limit
+        self.__compiled = None
         return self
 
     def skip(self, skip):
@@ -102,43 +186,87 @@ class Query(object):
             :param skip: the number of documents to skip
         '''
         self._skip = skip
+        self.__compiled = None
+        return self
+
+    def batch_size(self, batch_size):
+        ''' Sets the number of documents the server returns in each batch
+            of results.  This does not change the results of the query.
+            pymongo buffers each batch, so a larger batch means fewer
+            round trips to the server while the results are iterated over.
+
+            :param batch_size: the number of documents per batch
+        '''
+        self._batch_size = batch_size
+        self.__compiled = None
         return self
 
+    def compile(self):
+        ''' Freeze the current state of the query into a
+            :class:`CompiledQuery`.  Executing the compiled query repeatedly
+            skips all of the query building work, and later changes to this
+            query do not affect it.  Each call returns a new compiled query,
+            so changing one does not affect this query or other compiled
+            queries.
+        '''
+        compiled = self._compiled()
+        return compiled._replace(query=_copy_query(compiled.query),
+                                 fields=_copy_query(compiled.fields),
+                                 sort=_copy_query(compiled.sort),
+                                 hints=list(compiled.hints))
+
+    def _compiled(self):
+        ''' The compiled form of this query, kept until the query is next
+            changed.  It is shared by every execution of the query, so it
+            must not be modified; use ``_replace`` for a variant. '''
+        if self.__compiled is None:
+            self.__compiled = CompiledQuery(self)
+        return self.__compiled
+
     def clone(self):
         ''' Creates a clone of the current query and all settings.  Further
             updates to the cloned object or the original object will not
             affect each other
         '''
         qclone = Query(self.type, self.session)
-        qclone.__query = deepcopy(self.__query)
-        qclone._sort = deepcopy(self._sort)
-        qclone._fields = deepcopy(self._fields)
-        qclone._hints = deepcopy(self.hints)
-        qclone._limit = deepcopy(self._limit)
-        qclone._skip = deepcopy(self._skip)
-        qclone._raw_output = deepcopy(self._raw_output)
+        qclone.__query = _copy_query(self.__query)
+        qclone._sort = list(self._sort)
+        qclone._sort_names = set(self._sort_names)
+        if self._fields is not None:
+            qclone._fields = list(self._fields)
+            qclone.__fields_expr = self.__fields_expr
+            qclone.__field_names = self.__field_names
+        qclone.hints = list(self.hints)
+        qclone._hint_names = set(self._hint_names)
+        qclone._limit = self._limit
+        qclone._skip = self._skip
+        qclone._batch_size = self._batch_size
+        qclone._raw_output = self._raw_output
+        qclone._no_cache = self._no_cache
         return qclone
 
     def one(self):
         ''' Execute the query and return one result.  If more than one result
             is returned, raises a ``BadResultException``
         '''
-        count = -1
-        for count, result in enumerate(self):
-            if count > 0:
-                raise BadResultException('Too many results for .one()')
-        if count == -1:
+        # two documents are enough to know there are too many, so don't
+        # let the server send any more than that
+        compiled = self._compiled()
+        if not compiled.limit or compiled.limit > 2:
+            compiled = compiled._replace(limit=2)
+        results = list(compiled())
+        if not results:
             raise BadResultException('Too few results for .one()')
-        return result
+        if len(results) > 1:
+            raise BadResultException('Too many results for .one()')
+        return results[0]
 
     def first(self):
         ''' Execute the query and return the first result.  Unlike ``one``, if
             there are multiple documents it simply returns the first one.  If
             there are no documents, first returns ``None``
         '''
-        for doc in iter(self):
-            return doc
-        return None
+        return next(self._compiled()._replace(limit=1)(), None)
 
     def __getitem__(self, index):
         return self.__get_query_result().__getitem__(index)
@@ -162,10 +290,11 @@ class Query(object):
     def __hint(self, qfield, direction):
         qfield = resolve_name(self.type, qfield)
         name = str(qfield)
-        for n, _ in self.hints:
-            if n == name:
-                raise BadQueryException('Already gave hint for %s' % name)
+        if name in self._hint_names:
+            raise BadQueryException('Already gave hint for %s' % name)
+        self._hint_names.add(name)
         self.hints.append((name, direction))
+        self.__compiled = None
         return self
 
     def explain(self):
@@ -176,7 +305,13 @@ class Query(object):
 
     def all(self):
         ''' Return all of the results of a query in a list'''
-        return [obj for obj in iter(self)]
+        result = self.__get_query_result()
+        # loop over the cursor directly rather than through next(), which
+        # adds a method call per document
+        if result.raw_output:
+            return list(result.cursor)
+        load = result._load
+        return [load(value) for value in result.cursor]
 
     def distinct(self, key):
         ''' Execute this query and return all of the unique values
@@ -205,8 +340,11 @@ class Query(object):
     def filter_by(self, **filters):
         ''' Filter for the names in ``filters`` being equal to the associated
             values.  Cannot be used for sub-objects since keys must be strings'''
+        qe_dict = {}
         for name, value in filters.items():
-            self.filter(resolve_name(self.type, name) == value)
+            qfield = resolve_name(self.type, name)
+            qe_dict[qfield] = qfield.get_type().wrap_value(value)
+        self._apply_dict(qe_dict)
         return self
 
     def count(self, with_limit_and_skip=False):
@@ -225,19 +363,23 @@ class Query(object):
             :param fields: Instances of :class:``mongoalchemy.query.QueryField`` specifying \
                 which fields to return
         '''
+        self.__fields_expr = None
+        self.__field_names = None
+        self.__compiled = None
+        type = self.type
+        # a list rather than a set, so that the last field given for a name
+        # wins (e.g. mongo_id.exclude() over the implicit mongo_id); names
+        # are deduplicated when the projection is built
         if self._fields is None:
-            self._fields = set()
-        for f in fields:
-            f = resolve_name(self.type, f)
-            self._fields.add(f)
-        self._fields.add(self.type.mongo_id)
+            self._fields = [type.mongo_id]
+        self._fields.extend(resolve_name(type, f) for f in fields)
         return self
 
     def _fields_expression(self):
-        fields = {}
-        for f in self._get_fields():
-            fields[f.get_absolute_name()] = f.fields_expression
-        return fields
+        if self.__fields_expr is None:
+            self.__fields_expr = dict((f.get_absolute_name(), f.fields_expression)
+                                      for f in self._get_fields())
+        return self.__fields_expr
 
 
     def _apply(self, qe):
@@ -246,14 +388,35 @@ class Query(object):
 
     def _apply_dict(self, qe_dict):
         ''' Apply a query expression, updating the query object '''
+        self.__flat_query = None
+        self.__compiled = None
+        query = self.__query
+        # the first expression on an empty query has nothing to merge with
+        if not query and not any(isinstance(k, basestring) for k in qe_dict):
+            query.update(qe_dict)
+            return
+        get = query.get
         for k, v in qe_dict.items():
-            k = resolve_name(self.type, k)
-            if not k in self.__query:
-                self.__query[k] = v
-                continue
-            if not isinstance(self.__query[k], dict) or not isinstance(v, dict):
+            # keys from query expressions are already QueryFields
+            if isinstance(k, basestring):
+                k = resolve_name(self.type, k)
+            existing = get(k, _MISSING)
+            if existing is _MISSING:
+                query[k] = v
+            elif isinstance(existing, dict) and isinstance(v, dict):
+                # an operator repeated with a different value would overwrite
+                # the first one, so it becomes a separate clause of an $and
+                if any(op in existing and existing[op] != value
+                       for op, value in v.items()):
+                    query['$and'] = query.get('$and', []) + [{ k : v }]
+                else:
+                    # merge into a new dict: flattened queries may share the
+                    # existing one
+                    merged = dict(existing)
+                    merged.update(v)
+                    query[k] = merged
+            else:
                 raise BadQueryException('Multiple assignments to a field must all be dicts.')
-            self.__query[k].update(**v)
 
 
     def ascending(self, qfield):
@@ -279,24 +442,23 @@ class Query(object):
 
             :param sort_tuples: varargs of sort tuples.
         '''
-        query = self
         for name, direction in sort_tuples:
-            field = resolve_name(self.type, name)
             if direction in (ASCENDING, 1):
-                query = query.ascending(field)
+                self.__sort(name, ASCENDING)
             elif direction in (DESCENDING, -1):
-                query = query.descending(field)
+                self.__sort(name, DESCENDING)
             else:
                 raise BadQueryException('Bad sort direction: %s' % direction)
-        return query
+        return self
 
     def __sort(self, qfield, direction):
         qfield = resolve_name(self.type, qfield)
         name = str(qfield)
-        for n, _ in self._sort:
-            if n == name:
-                raise BadQueryException('Already sorting by %s' % name)
+        if name in self._sort_names:
+            raise BadQueryException('Already sorting by %s' % name)
+        self._sort_names.add(name)
         self._sort.append((name, direction))
+        self.__compiled = None
         return self
 
     def not_(self, *query_expressions):
@@ -312,17 +474,20 @@ class Query(object):
         return self
 
     def or_(self, first_qe, *qes):
-        ''' Add a $not expression to the query, negating the query expressions
-            given.  The ``| operator`` on query expressions does the same thing
+        ''' Add a $or expression to the query, matching documents which match
+            any of the query expressions given.  The ``| operator`` on query
+            expressions does the same thing
 
             **Examples**: ``query.or_(SomeDocClass.age == 18, SomeDocClass.age == 17)`` becomes ``{'$or' : [{ 'age' : 18 }, { 'age' : 17 }]}``
 
             :param query_expressions: Instances of :class:`mongoalchemy.query_expression.QueryExpression`
         '''
-        res = first_qe
+        if not qes:
+            return self.filter(first_qe)
+        clauses = list(_or_clauses(first_qe.obj))
         for qe in qes:
-            res = (res | qe)
-        self.filter(res)
+            clauses.extend(_or_clauses(qe.obj))
+        self._apply_dict({ '$or' : clauses })
         return self
 
     def in_(self, qfield, *values):
@@ -334,7 +499,8 @@ class Query(object):
         '''
         # TODO: make sure that this field represents a list
         qfield = resolve_name(self.type, qfield)
-        self.filter(QueryExpression({ qfield : { '$in' : [qfield.wrap_value(value) for value in values]}}))
+        wrap = qfield.get_type().wrap_value
+        self._apply_dict({ qfield : { '$in' : list(map(wrap, values))}})
         return self
 
     def nin(self, qfield, *values):
@@ -346,7 +512,8 @@ class Query(object):
         '''
         # TODO: make sure that this field represents a list
         qfield = resolve_name(self.type, qfield)
-        self.filter(QueryExpression({ qfield : { '$nin' : [qfield.wrap_value(value) for value in values]}}))
+        wrap = qfield.get_type().wrap_value
+        self._apply_dict({ qfield : { '$nin' : list(map(wrap, values))}})
         return self
 
     def find_and_modify(self, new=False, remove=False):
@@ -400,56 +567,118 @@ class Query(object):
         ''' Refer to:  :func:`~mongoalchemy.update_expression.UpdateExpression.pop_last`'''
         return UpdateExpression(self).pop_last(qfield)
 
+class CompiledQuery(object):
+    ''' A snapshot of a :class:`Query` which can be executed many times.
+        Create one with :func:`Query.compile` and call or iterate it to get
+        a :class:`QueryResult`.
+    '''
+    __slots__ = ('session', 'type', 'collection_name', 'query', 'fields',
+                 'field_names', 'sort', 'hints', 'limit', 'skip',
+                 'batch_size', 'raw_output', 'no_cache')
+
+    def __init__(self, query):
+        type = query.type
+        self.session = query.session
+        self.type = type
+        self.collection_name = type.get_collection_name()
+        self.query = query._get_query()
+        self.fields = query._fields_expression() if query._get_fields() else None
+        self.field_names = query._get_field_names()
+        self.sort = list(query._sort) or type.config_default_sort
+        self.hints = list(query.hints)
+        self.limit = query._get_limit()
+        self.skip = query._get_skip()
+        self.batch_size = query._get_batch_size()
+        self.raw_output = query._raw_output
+        self.no_cache = query._no_cache
+
+    def __call__(self, session=None):
+        ''' Execute the compiled query.
+
+            :param session: The session to load the results into.  Defaults \
+                to the session of the query which was compiled.
+        '''
+        return self.session.execute_compiled(self, session=session)
+
+    def __iter__(self):
+        return self.session.execute_compiled(self)
+
+    def _replace(self, **changes):
+        ''' A copy of this compiled query with the attributes in
+            ``changes`` set, e.g. ``_replace(limit=1)`` '''
+        compiled = CompiledQuery.__new__(CompiledQuery)
+        for name in CompiledQuery.__slots__:
+            setattr(compiled, name, changes.get(name, getattr(self, name)))
+        return compiled
+
 class QueryResult(object):
-    def __init__(self, session, cursor, type, raw_output=False, fields=None):
+    __slots__ = ('cursor', 'type', 'fields', 'raw_output', 'no_cache',
+                 'session')
+
+    def __init__(self, session, cursor, type, raw_output=False, fields=None,
+                 no_cache=False):
         self.cursor = cursor
         self.type = type
         self.fields = fields
         self.raw_output = raw_output
+        self.no_cache = no_cache
         self.session = session
 
     def next(self):
-        return self._next_internal()
+        # raw results need no per-document work
+        if self.raw_output:
+            return self.cursor.next()
+        return self._load(self.cursor.next())
     __next__ = next
 
-    def _next_internal(self):
-        value = next(self.cursor)
-        if not self.raw_output:
-            db = self.cursor.collection.database
-            conn = db.connection
-            obj = self.session.cache_read(value['_id'])
-            if obj:
-                return obj
-            value = self.session._unwrap(self.type, value, fields=self.fields)
-            if not isinstance(value, dict):
-                self.session.cache_write(value)
+    def _load(self, value):
+        ''' Turn a raw document from the cursor into the value to return.
+            Used by ``next``, ``__getitem__`` and iteration alike. '''
+        session = self.session
+        if session.cache_size == 0:
+            # without an identity map the cache calls are no-ops
+            return session._unwrap(self.type, value, fields=self.fields)
+        obj = session.cache_read(value['_id'])
+        if obj:
+            return obj
+        value = session._unwrap(self.type, value, fields=self.fields)
+        if not self.no_cache and not isinstance(value, dict):
+            session.cache_write(value)
         return value
 
     def __getitem__(self, index):
-        value = self.cursor.__getitem__(index)
-        if not self.raw_output:
-            db = self.cursor.collection.database
-            conn = db.connection
-            obj = self.session.cache_read(value['_id'])
-            if obj:
-                return obj
-            value = self.session._unwrap(self.type, value)
-            self.session.cache_write(value)
-            # value = self.session.localize(session, value)
-        return value
+        value = self.cursor[index]
+        if isinstance(index, slice):
+            # pymongo gives back a cursor limited to the slice; keep it lazy
+            return QueryResult(self.session, value, self.type,
+                raw_output=self.raw_output, fields=self.fields,
+                no_cache=self.no_cache)
+        if self.raw_output:
+            return value
+        return self._load(value)
 
     def rewind(self):
         return self.cursor.rewind()
 
+    def batch_size(self, batch_size):
+        ''' Set the number of documents fetched from the server in each
+            batch for the rest of this result.  See :func:`Query.batch_size`
+        '''
+        self.cursor.batch_size(batch_size)
+        return self
+
     def clone(self):
         return QueryResult(self.session, self.cursor.clone(), self.type,
-            raw_output=self.raw_output, fields=self.fields)
+            raw_output=self.raw_output, fields=self.fields,
+            no_cache=self.no_cache)
 
     def __iter__(self):
         return self
 
 
 class RemoveQuery(object):
+    __slots__ = ('session', 'type', 'safe', 'get_last_args', '__query_obj')
+
     def __init__(self, type, session):
         ''' Execute a remove query to remove the matched objects from the database
 
@@ -472,7 +701,7 @@ class RemoveQuery(object):
             MongoDB's getLastError command (as in pymongo's remove).
         '''
         self.safe = is_safe
-        self.get_last_args.update(**kwargs)
+        self.get_last_args.update(kwargs)
         return self
 
     def execute(self):
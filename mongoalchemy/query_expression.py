@@ -26,6 +26,23 @@ from mongoalchemy.py3compat import *
 from mongoalchemy.exceptions import BadValueException
 
 import re
+import weakref
+
+# QueryFields handed out by FreeFormDoc attribute access, shared by name for
+# as long as something still refers to them
+_free_form_fields = weakref.WeakValueDictionary()
+
+_MISSING = object()
+
+# characters with a meaning in a (possibly extended) regular expression
+_REGEX_SPECIAL = re.compile(r'[\\.^$*+?{}\[\]|()&~#\s-]')
+
+def _escape(text):
+    ''' ``re.escape``, except that text with nothing to escape (a plain word
+        or slug, say) is returned as is. '''
+    if _REGEX_SPECIAL.search(text) is None:
+        return text
+    return re.escape(text)
 
 class BadQueryException(Exception):
     ''' Raised when a method would result in a query which is not well-formed.
@@ -33,6 +50,7 @@ class BadQueryException(Exception):
     pass
 
 class FreeFormField(object):
+    __slots__ = ('__name', 'db_field')
     has_subfields = True
     no_real_attributes = True
 
@@ -58,7 +76,10 @@ class FreeFormDoc(object):
     def __init__(self, name):
         self.__name = name
     def __getattr__(self, name):
-        return QueryField(FreeFormField(name))
+        qfield = _free_form_fields.get(name)
+        if qfield is None:
+            qfield = _free_form_fields[name] = QueryField(FreeFormField(name))
+        return qfield
     @classmethod
     def base_query(*args, **kwargs):
         return {}
@@ -71,28 +92,35 @@ class FreeFormDoc(object):
         return obj
     def get_indexes(self):
         return []
+    def __eq__(self, other):
+        return isinstance(other, FreeFormDoc) and other.__name == self.__name
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    def __hash__(self):
+        return hash(self.__name)
     mongo_id = FreeFormField(name='_id')
 
 Q = FreeFormDoc('')
 
 class QueryField(object):
+    __slots__ = ('__type', '__parent', '__cached_id_value', '__matched_index',
+                 '__fields_expr', '__children', '__is_elem_match',
+                 '__weakref__')
+
     def __init__(self, type, parent=None):
         self.__type = type
         self.__parent = parent
         self.__cached_id_value = None
         self.__matched_index = False
         self.__fields_expr = True
+        # created on first use, since most QueryFields (copies, children)
+        # never need it
+        self.__children = None
 
     @property
     def fields_expression(self):
         return flatten(self.__fields_expr)
 
-    @property
-    def __cached_id(self):
-        if self.__cached_id_value is None:
-            self.__cached_id_value = str(self)
-        return self.__cached_id_value
-
     def _get_parent(self):
         return self.__parent
 
@@ -100,35 +128,62 @@ class QueryField(object):
         ''' Returns the underlying :class:`mongoalchemy.fields.Field` '''
         return self.__type
 
+    def __copy(self):
+        # QueryFields for document attributes are shared, so the methods
+        # which configure a field work on a copy
+        qfield = QueryField(self.__type, parent=self.__parent)
+        qfield.__matched_index = self.__matched_index
+        qfield.__fields_expr = self.__fields_expr
+        return qfield
+
     def matched_index(self):
         ''' Represents the matched array index on a query with objects inside
             of a list.  In the MongoDB docs, this is the ``$`` operator '''
-        self.__matched_index = True
-        return self
+        qfield = self.__copy()
+        qfield.__matched_index = True
+        return qfield
 
     def __getattr__(self, name):
-        if not self.__type.no_real_attributes and hasattr(self.__type, name):
-            return getattr(self.__type, name)
+        type = self.__type
+        if not type.no_real_attributes:
+            value = getattr(type, name, _MISSING)
+            if value is not _MISSING:
+                return value
 
-        if not self.__type.has_subfields:
+        if not type.has_subfields:
             raise AttributeError(name)
 
-        fields = self.__type.subfields()
-        if name not in fields:
-            raise BadQueryException('%s is not a field in %s' % (name, self.__type.sub_type()))
-        return QueryField(fields[name], parent=self)
+        children = self.__children
+        if children is not None:
+            child = children.get(name)
+            if child is not None:
+                return child
+        try:
+            field = type.subfields()[name]
+        except KeyError:
+            raise BadQueryException('%s is not a field in %s' % (name, type.sub_type()))
+        child = QueryField(field, parent=self)
+        if children is None:
+            # a document's subfields are a fixed set, but free-form names are
+            # arbitrary, so those children are only kept while in use
+            if type.no_real_attributes:
+                children = weakref.WeakValueDictionary()
+            else:
+                children = {}
+            self.__children = children
+        children[name] = child
+        return child
 
     def get_absolute_name(self):
         """ Returns the full dotted name of this field """
-        res = []
-        current = self
-
-        while type(current) != type(None):
-            if current.__matched_index:
-                res.append('$')
-            res.append(current.get_type().db_field)
-            current = current._get_parent()
-        return '.'.join(reversed(res))
+        if self.__cached_id_value is None:
+            name = self.__type.db_field
+            if self.__parent is not None:
+                name = self.__parent.get_absolute_name() + '.' + name
+            if self.__matched_index:
+                name += '.$'
+            self.__cached_id_value = intern_name(name)
+        return self.__cached_id_value
 
     def startswith(self, prefix, ignore_case=False, options=None):
         """ A query to check if a field starts with a given prefix string
@@ -141,7 +196,7 @@ class QueryField(object):
                 will be optimized by matching only against the prefix.
 
         """
-        return self.regex('^' + re.escape(prefix), ignore_case=ignore_case, options=options)
+        return self.regex('^' + _escape(prefix), ignore_case=ignore_case, options=options)
 
     def endswith(self, suffix, ignore_case=False, options=None):
         """ A query to check if a field ends with a given suffix string
@@ -149,7 +204,7 @@ class QueryField(object):
             **Example**: ``session.query(Spell).filter(Spells.name.endswith("cadabra", ignore_case=True))``
 
         """
-        return self.regex(re.escape(suffix) + '$', ignore_case=ignore_case, options=options)
+        return self.regex(_escape(suffix) + '$', ignore_case=ignore_case, options=options)
 
     def regex(self, expression, ignore_case=False, options=None):
         """ A query to check if a field matches a given regular expression
@@ -172,11 +227,12 @@ class QueryField(object):
     def near(self, x, y, max_distance=None):
         """ Return documents near the given point
         """
+        inner = {'$near' : [x, y]}
+        if max_distance is not None:
+            inner['$maxDistance'] = max_distance
         expr = {
-            self : {'$near' : [x, y]}
+            self : inner
         }
-        if max_distance is not None:
-            expr[self]['$maxDistance'] = max_distance
         # if bucket_size is not None:
         #     expr['$bucketSize'] = max_distance
         return QueryExpression(expr)
@@ -184,11 +240,12 @@ class QueryField(object):
     def near_sphere(self, x, y, max_distance=None):
         """ Return documents near the given point using sphere distances
         """
+        inner = {'$nearSphere' : [x, y]}
+        if max_distance is not None:
+            inner['$maxDistance'] = max_distance
         expr = {
-            self : {'$nearSphere' : [x, y]}
+            self : inner
         }
-        if max_distance is not None:
-            expr[self]['$maxDistance'] = max_distance
         return QueryExpression(expr)
 
     def within_box(self, corner1, corner2):
@@ -243,16 +300,18 @@ class QueryField(object):
         ''' A query to check if this query field is one of the values
             in ``values``.  Produces a MongoDB ``$in`` expression.
         '''
+        wrap = self.__type.wrap_value
         return QueryExpression({
-            self : { '$in' : [self.get_type().wrap_value(value) for value in values] }
+            self : { '$in' : list(map(wrap, values)) }
         })
 
     def nin(self, *values):
         ''' A query to check if this query field is not one of the values
             in ``values``.  Produces a MongoDB ``$nin`` expression.
         '''
+        wrap = self.__type.wrap_value
         return QueryExpression({
-            self : { '$nin' : [self.get_type().wrap_value(value) for value in values] }
+            self : { '$nin' : list(map(wrap, values)) }
         })
 
     def exists(self, exists=True):
@@ -261,71 +320,65 @@ class QueryField(object):
         return QueryExpression({self: {'$exists': exists}})
 
     def __str__(self):
-        return self.get_absolute_name()
+        return self.__cached_id_value or self.get_absolute_name()
 
     def __repr__(self):
         return 'QueryField(%s)' % str(self)
 
     def __hash__(self):
-        return hash(self.__cached_id)
+        return hash(self.__cached_id_value or self.get_absolute_name())
 
-    def __eq__(self, value):
-        return self.eq_(value)
     def eq_(self, value):
         ''' Creates a query expression where ``this field == value``
 
             .. note:: The prefered usage is via an operator: ``User.name == value``
         '''
         if isinstance(value, QueryField):
-            return self.__cached_id == value.__cached_id
-        return QueryExpression({ self : self.get_type().wrap_value(value) })
+            return self.get_absolute_name() == value.get_absolute_name()
+        return QueryExpression({ self : self.__type.wrap_value(value) })
+    __eq__ = eq_
 
-    def __lt__(self, value):
-        return self.lt_(value)
     def lt_(self, value):
         ''' Creates a query expression where ``this field < value``
 
             .. note:: The prefered usage is via an operator: ``User.name < value``
         '''
-        return self.__comparator('$lt', value)
+        return QueryExpression({ self : { '$lt' : self.__type.wrap(value) } })
+    __lt__ = lt_
 
-    def __le__(self, value):
-        return self.le_(value)
     def le_(self, value):
         ''' Creates a query expression where ``this field <= value``
 
             .. note:: The prefered usage is via an operator: ``User.name <= value``
         '''
-        return self.__comparator('$lte', value)
+        return QueryExpression({ self : { '$lte' : self.__type.wrap(value) } })
+    __le__ = le_
 
-    def __ne__(self, value):
-        return self.ne_(value)
     def ne_(self, value):
         ''' Creates a query expression where ``this field != value``
 
             .. note:: The prefered usage is via an operator: ``User.name != value``
         '''
         if isinstance(value, QueryField):
-            return self.__cached_id != value.__cached_id
-        return self.__comparator('$ne', value)
+            return self.get_absolute_name() != value.get_absolute_name()
+        return QueryExpression({ self : { '$ne' : self.__type.wrap(value) } })
+    __ne__ = ne_
 
-    def __gt__(self, value):
-        return self.gt_(value)
     def gt_(self, value):
         ''' Creates a query expression where ``this field > value``
 
             .. note:: The prefered usage is via an operator: ``User.name > value``
         '''
-        return self.__comparator('$gt', value)
+        return QueryExpression({ self : { '$gt' : self.__type.wrap(value) } })
+    __gt__ = gt_
 
-    def __ge__(self, value):
-        return self.ge_(value)
     def ge_(self, value):
         ''' Creates a query expression where ``this field >= value``
 
             .. note:: The prefered usage is via an operator: ``User.name >= value``
         '''
-        return self.__comparator('$gte', value)
+        return QueryExpression({ self : { '$gte' : self.__type.wrap(value) } })
+    __ge__ = ge_
 
     def elem_match(self, value):
         ''' This method does two things depending on the context:
@@ -347,17 +400,18 @@ class QueryField(object):
             of a list are used. See the mongo docs for more details:
             http://docs.mongodb.org/manual/reference/projection/elemMatch/
         '''
-        self.__is_elem_match = True
         if not self.__type.is_sequence_field:
             raise BadQueryException('elem_match called on a non-sequence '
                                     'field: ' + str(self))
+        qfield = self.__copy()
+        qfield.__is_elem_match = True
         if isinstance(value, dict):
-            self.__fields_expr = { '$elemMatch' : value}
-            return ElemMatchQueryExpression(self, {self : self.__fields_expr })
+            qfield.__fields_expr = { '$elemMatch' : value}
+            return ElemMatchQueryExpression(qfield, {qfield : qfield.__fields_expr })
         elif isinstance(value, QueryExpression):
-            self.__fields_expr = { '$elemMatch' : value.obj }
-            e = ElemMatchQueryExpression(self, {
-                       self : self.__fields_expr
+            qfield.__fields_expr = { '$elemMatch' : value.obj }
+            e = ElemMatchQueryExpression(qfield, {
+                       qfield : qfield.__fields_expr
                 })
             return e
         raise BadQueryException('elem_match requires a QueryExpression '
@@ -370,15 +424,9 @@ class QueryField(object):
             fields which are specified. This allows retrieving of "every field
             except 'foo'".
         '''
-        self.__fields_expr = False
-        return self
-
-    def __comparator(self, op, value):
-        return QueryExpression({
-            self : {
-                op : self.get_type().wrap(value)
-            }
-        })
+        qfield = self.__copy()
+        qfield.__fields_expr = False
+        return qfield
 
 
 class QueryExpression(object):
@@ -388,6 +436,8 @@ class QueryExpression(object):
         .. note:: There is no ``and_`` expression because multiple expressions
             can be specified to a single call of :func:`Query.filter`
     '''
+    __slots__ = ('obj',)
+
     def __init__(self, obj):
         self.obj = obj
     def not_(self):
@@ -404,19 +454,18 @@ class QueryExpression(object):
             if not isinstance(v, dict):
                 ret_obj[k] = {'$ne' : v }
                 continue
-            num_ops = len([x for x in v if x[0] == '$'])
-            if num_ops != len(v) and num_ops != 0:
-                raise BadQueryException('$ operator used in field name')
-
+            num_ops = 0
+            for op in v:
+                if op[:1] == '$':
+                    num_ops += 1
             if num_ops == 0:
                 ret_obj[k] = {'$ne' : v }
                 continue
+            if num_ops != len(v):
+                raise BadQueryException('$ operator used in field name')
 
-            for op, value in v.items():
-                k_dict = ret_obj.setdefault(k, {})
-                not_dict = k_dict.setdefault('$not', {})
-                not_dict[op] = value
-
+            # every key is an operator, so the dict can be negated as a whole
+            ret_obj[k] = {'$not' : dict(v)}
 
         return QueryExpression(ret_obj)
 
@@ -436,11 +485,13 @@ class QueryExpression(object):
 
             '''
 
-        if '$or' in self.obj:
-            self.obj['$or'].append(expression.obj)
+        clauses = _or_clauses(expression.obj)
+        if len(self.obj) == 1 and '$or' in self.obj:
+            # a new list, since queries this was applied to share the old one
+            self.obj['$or'] = self.obj['$or'] + clauses
             return self
         self.obj = {
-            '$or' : [self.obj, expression.obj]
+            '$or' : [self.obj] + clauses
         }
         return self
 
@@ -448,6 +499,8 @@ class ElemMatchQueryExpression(QueryExpression):
     ''' Special QueryExpression subclass which can also be used
         in a query.fields() expression. Shouldn't be used directly.
     '''
+    __slots__ = ('_field',)
+
     def __init__(self, field, obj):
         QueryExpression.__init__(self, obj)
         self._field = field
@@ -460,6 +513,20 @@ class ElemMatchQueryExpression(QueryExpression):
         return self._field.fields_expression
 
 
+def _or_clauses(obj):
+    ''' The clauses a query dict adds to an ``$or``.  A dict holding nothing
+        but an ``$or`` contributes its clauses, so or-ing expressions
+        together gives one flat list; anything else is a single clause. '''
+    if len(obj) == 1 and '$or' in obj:
+        return obj['$or']
+    return [obj]
+
+def _is_flat(obj):
+    for k, v in obj.items():
+        if not isinstance(k, basestring) or isinstance(v, (dict, list)):
+            return False
+    return True
+
 def flatten(obj):
     if not isinstance(obj, dict):
         return obj
@@ -467,9 +534,12 @@ def flatten(obj):
     for k, v in obj.items():
         if not isinstance(k, basestring):
             k = str(k)
+        # nested dicts which are already flat (e.g. {'$gt' : 3}) are shared
+        # rather than copied; queries replace them instead of modifying them
         if isinstance(v, dict):
-            v = flatten(v)
-        if isinstance(v, list):
+            if not _is_flat(v):
+                v = flatten(v)
+        elif isinstance(v, list):
             v = [flatten(x) for x in v]
         ret[k] = v
     return ret
@@ -43,6 +43,7 @@ else: # pragma: no cover
 if hasattr(pymongo, 'mongo_replica_set_client'):
     from pymongo.mongo_replica_set_client import MongoReplicaSetClient
 
+from pymongo.errors import OperationFailure
 from bson import DBRef, ObjectId
 from mongoalchemy.query import Query, QueryResult, RemoveQuery
 from mongoalchemy.document import (FieldNotRetrieved, Document,
@@ -66,8 +67,10 @@ class Session(object):
             :class:`pymongo.database.Database`
         :param safe: Whether the "safe" option should be used on mongo writes, \
             blocking to make sure there are no errors.
-        :param auto_ensure: Whether to implicitly call ensure_indexes on all write \
-            operations.
+        :param auto_ensure: Whether to implicitly call ensure_indexes the first \
+            time the session queries or writes each document class.  To ensure \
+            indexes once per process instead, turn this off and call \
+            ensure_indexes at startup.
 
         **Fields**:
             * db: the underlying pymongo database object
@@ -77,6 +80,8 @@ class Session(object):
                             are pulled from the DB they are checked against this \
                             map and if present, the existing object is used.  \
                             Defaults to 0, use None to only clear at session end.
+            * ensured_types: The document classes whose indexes this session \
+                has already ensured.
 
         '''
         self.db = database
@@ -89,6 +94,8 @@ class Session(object):
         self.cache_size = cache_size
         self.cache = {}
         self.transactions = []
+        self.ensured_types = set()
+        self._collections = {}
     @property
     def autoflush(self):
         return not self.in_transaction
@@ -105,8 +112,8 @@ class Session(object):
                     :class:`basestring`
             :param safe: The value for the "safe" parameter of the Session \
                 init function
-            :param auto_ensure: Whether to implicitly call ensure_indexes on all write \
-                operations.
+            :param auto_ensure: Whether to implicitly call ensure_indexes the first \
+                time the session queries or writes each document class.
             :param replica_set: The replica-set to use (as a string). If specified, \
                 :class:`pymongo.mongo_replica_set_client.MongoReplicaSetClient` is used \
                 instead of :class:`pymongo.mongo_client.MongoClient`
@@ -240,34 +247,43 @@ class Session(object):
     def add_to_session(self, obj):
         obj._set_session(self)
 
-    def execute_query(self, query, session):
+    def execute_query(self, query, session=None):
         ''' Get the results of ``query``.  This method does flush in a
             transaction, so any objects retrieved which are not in the cache
             which would be updated when the transaction finishes will be
             stale '''
-        self.auto_ensure_indexes(query.type)
-
-        kwargs = dict()
-        if query._get_fields():
-            if PYMONGO_3: # pragma: nocover
-                kwargs['projection'] = query._fields_expression()
-            else: # pragma: nocover
-                kwargs['fields'] = query._fields_expression()
-
-        collection = self.db[query.type.get_collection_name()]
-        cursor = collection.find(query.query, **kwargs)
-
-        if query._sort:
-            cursor.sort(query._sort)
-        elif query.type.config_default_sort:
-            cursor.sort(query.type.config_default_sort)
-        if query.hints:
-            cursor.hint(query.hints)
-        if query._get_limit() is not None:
-            cursor.limit(query._get_limit())
-        if query._get_skip() is not None:
-            cursor.skip(query._get_skip())
-        return QueryResult(session, cursor, query.type, raw_output=query._raw_output, fields=query._get_fields())
+        return self.execute_compiled(query._compiled(), session=session)
+
+    def execute_compiled(self, compiled, session=None):
+        ''' Get the results of a
+            :class:`~mongoalchemy.query.CompiledQuery`.  The same caveats as
+            ``execute_query`` apply. '''
+        if session is None:
+            session = self
+        self.auto_ensure_indexes(compiled.type)
+
+        # the projection is find's second positional argument on every
+        # pymongo version (``fields`` before 3.0, ``projection`` after).
+        # sort, limit and skip are find keywords everywhere too, so they are
+        # given up front rather than set on the cursor afterwards
+        kwargs = {}
+        if compiled.sort:
+            kwargs['sort'] = compiled.sort
+        if compiled.limit is not None:
+            kwargs['limit'] = compiled.limit
+        if compiled.skip is not None:
+            kwargs['skip'] = compiled.skip
+        collection = self._get_collection(compiled.collection_name)
+        cursor = collection.find(compiled.query, compiled.fields, **kwargs)
+
+        if compiled.hints:
+            cursor.hint(compiled.hints)
+        if compiled.batch_size is not None:
+            cursor.batch_size(compiled.batch_size)
+        return QueryResult(session, cursor, compiled.type,
+                           raw_output=compiled.raw_output,
+                           fields=compiled.field_names,
+                           no_cache=compiled.no_cache)
 
     def remove_query(self, type):
         ''' Begin a remove query on the database's collection for `type`.
@@ -325,9 +341,9 @@ class Session(object):
         self.flush()
         self.auto_ensure_indexes(fm_exp.query.type)
         # assert len(fm_exp.update_data) > 0
-        collection = self.db[fm_exp.query.type.get_collection_name()]
+        collection = self._get_collection(fm_exp.query.type.get_collection_name())
         kwargs = {
-            'query' : fm_exp.query.query,
+            'query' : fm_exp.query._get_query(),
             'update' : fm_exp.update_data,
             'upsert' : fm_exp._get_upsert(),
         }
@@ -357,11 +373,19 @@ class Session(object):
         # if obj is not None:
         #     return obj
         obj = self._unwrap(fm_exp.query.type, value,
-                           fields=fm_exp.query._get_fields())
+                           fields=fm_exp.query._get_field_names())
         if not fm_exp.query._get_fields():
             self.cache_write(obj)
         return obj
 
+    def _get_collection(self, name):
+        ''' The pymongo collection called ``name``.  The collection object is
+            created the first time it is used and reused after that. '''
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = self.db[name]
+        return collection
+
     def _unwrap(self, type, obj, **kwargs):
         obj = type.transform_incoming(obj, session=self)
         return type.unwrap(obj, session=self, **kwargs)
@@ -376,15 +400,35 @@ class Session(object):
         ''' Get the index information for the collection associated with
         `cls`.  Index information is returned in the same format as *pymongo*.
         '''
-        return self.db[cls.get_collection_name()].index_information()
+        return self._get_collection(cls.get_collection_name()).index_information()
 
     def ensure_indexes(self, cls):
-        collection = self.db[cls.get_collection_name()]
-        for index in cls.get_indexes():
-            index.ensure(collection)
+        collection = self._get_collection(cls.get_collection_name())
+        indexes = cls.get_indexes()
+        if PYMONGO_3: # pragma: nocover
+            models = [i.index_model() for i in indexes]
+            if models:
+                try:
+                    # one round trip for all of the indexes
+                    collection.create_indexes(models)
+                except OperationFailure:
+                    # createIndexes was added in MongoDB 2.6, so create the
+                    # indexes one at a time on older servers
+                    for model in models:
+                        options = dict(model.document)
+                        keys = options.pop('key')
+                        collection.create_index(list(keys.items()), **options)
+        else: # pragma: nocover
+            for index in indexes:
+                index.ensure(collection)
+        self.ensured_types.add(cls)
 
     def auto_ensure_indexes(self, cls):
-        if self.auto_ensure:
+        ''' Ensure the indexes for ``cls`` if ``auto_ensure`` is on.  This is
+            only done the first time a session uses ``cls``, or the first
+            time after ``clear_collection``; call ``ensure_indexes`` directly
+            to force it again. '''
+        if self.auto_ensure and cls not in self.ensured_types:
             self.ensure_indexes(cls)
 
     def clear_queue(self, trans_id=None):
@@ -32,6 +32,17 @@ from mongoalchemy.query_expression import QueryExpression, BadQueryException, fl
 from mongoalchemy.util import resolve_name
 
 class UpdateExpression(object):
+    ''' An update to apply to the documents matched by a query.  Usually
+        created by one of the update methods on
+        :class:`~mongoalchemy.query.Query`.  Every update method returns the
+        same expression, so several operations can be chained into a single
+        update:
+
+        **Example**: ``query.set(User.name, 'Jeff').inc(User.visits).execute()``
+    '''
+    __slots__ = ('query', 'session', 'update_data', '__upsert', '__multi',
+                 '__safe')
+
     def __init__(self, query):
         self.query = query
         self.session = query.session
@@ -144,55 +155,35 @@ class UpdateExpression(object):
         return self._atomic_generic_op('$pop', qfield, -1)
 
     def _atomic_list_op_multivalue(self, op, qfield, *value):
-        qfield = resolve_name(self.query.type, qfield)
-        if op not in qfield.valid_modifiers:
-            raise InvalidModifierException(qfield, op)
-        wrapped = []
-        for v in value:
-            wrapped.append(qfield.get_type().item_type.wrap(v))
-        if op not in self.update_data:
-            self.update_data[op] = {}
-        self.update_data[op][qfield.get_absolute_name()] = value
-        return self
+        qfield, field = self._resolve_field(op, qfield)
+        wrap = field.item_type.wrap
+        return self._set_op(op, qfield, [wrap(v) for v in value])
 
     def _atomic_list_op(self, op, qfield, value):
-        qfield = resolve_name(self.query.type, qfield)
-        if op not in qfield.valid_modifiers:
-            raise InvalidModifierException(qfield, op)
-
-        if op not in self.update_data:
-            self.update_data[op] = {}
-        self.update_data[op][qfield.get_absolute_name()] = qfield.child_type().wrap(value)
-        return self
+        qfield, field = self._resolve_field(op, qfield)
+        return self._set_op(op, qfield, field.child_type().wrap(value))
 
     def _atomic_expression_op(self, op, qfield, value):
-        qfield = resolve_name(self.query.type, qfield)
-        if op not in qfield.valid_modifiers:
-            raise InvalidModifierException(qfield, op)
-
-        if op not in self.update_data:
-            self.update_data[op] = {}
-        self.update_data[op][qfield.get_absolute_name()] = flatten(value.obj)
-        return self
+        qfield, field = self._resolve_field(op, qfield)
+        return self._set_op(op, qfield, flatten(value.obj))
 
     def _atomic_op(self, op, qfield, value):
-        qfield = resolve_name(self.query.type, qfield)
-        if op not in qfield.valid_modifiers:
-            raise InvalidModifierException(qfield, op)
-
-        if op not in self.update_data:
-            self.update_data[op] = {}
-        self.update_data[op][qfield.get_absolute_name()] = qfield.wrap(value)
-        return self
+        qfield, field = self._resolve_field(op, qfield)
+        return self._set_op(op, qfield, field.wrap(value))
 
     def _atomic_generic_op(self, op, qfield, value):
+        qfield, field = self._resolve_field(op, qfield)
+        return self._set_op(op, qfield, value)
+
+    def _resolve_field(self, op, qfield):
         qfield = resolve_name(self.query.type, qfield)
-        if op not in qfield.valid_modifiers:
+        field = qfield.get_type()
+        if op not in field.valid_modifiers:
             raise InvalidModifierException(qfield, op)
+        return qfield, field
 
-        if op not in self.update_data:
-            self.update_data[op] = {}
-        self.update_data[op][qfield.get_absolute_name()] = value
+    def _set_op(self, op, qfield, value):
+        self.update_data.setdefault(op, {})[qfield.get_absolute_name()] = value
         return self
 
     def _get_upsert(self):
@@ -206,6 +197,8 @@ class UpdateExpression(object):
         self.session.execute_update(self, safe=self.__safe)
 
 class FindAndModifyExpression(UpdateExpression):
+    __slots__ = ('__new', '__remove')
+
     def __init__(self, query, new, remove):
         self.__new = new
         self.__remove = remove
@@ -205,6 +205,25 @@ def test_inheritance_queries():
     assert s.query(InD, exclude_subclasses=True).query['type'] == 'ind'
     assert s.query(InB2, exclude_subclasses=True).query['type'] == 'b2'
 
+def test_base_query():
+    class BqA(Document):
+        config_polymorphic = 'type'
+        config_polymorphic_collection = True
+        config_polymorphic_identity = 'bqa'
+        type = StringField()
+    query = BqA.base_query()
+    assert query == {'type' : {'$in' : ['bqa']}}, query
+
+    # changing a returned query doesn't affect later ones
+    query['type']['$ne'] = 'foo'
+    assert BqA.base_query() == {'type' : {'$in' : ['bqa']}}
+
+    # declaring a subclass adds it to the query
+    class BqB(BqA):
+        config_polymorphic_identity = 'bqb'
+    assert set(BqA.base_query()['type']['$in']) == set(['bqa', 'bqb'])
+    assert BqA.base_query(exclude_subclasses=True) == {'type' : 'bqa'}
+
 def test_exclude_with_normal_class():
     class PolyDoc(Document):
         config_polymorphic = True
@@ -4,7 +4,7 @@ from mongoalchemy.py3compat import *
 import pymongo
 from nose.tools import *
 from mongoalchemy.session import Session
-from mongoalchemy.document import Document, Index
+from mongoalchemy.document import Document, Index, BadIndexException
 from mongoalchemy.fields import *
 from datetime import datetime
 from test.util import known_failure
@@ -47,6 +47,37 @@ def test_indexes():
     got = json.dumps(got, sort_keys=True)
     assert got == desired, '\nG: %s\nD: %s' % (got, desired)
 
+def test_index_model():
+    if not PYMONGO_3:
+        return
+    def document(index):
+        doc = dict(index.index_model().document)
+        doc.pop('name')
+        doc['key'] = list(doc['key'].items())
+        return doc
+
+    assert document(TestDoc.index_1) == {
+        'key' : [('int1', 1), ('str_3_db_name', -1)]}
+    assert document(TestDoc.index_3) == {
+        'key' : [('str2', -1)], 'unique' : True}
+
+    index = Index().geo2d('loc', min=-100, max=100)
+    assert document(index) == {
+        'key' : [('loc', '2d')], 'min' : -100, 'max' : 100}
+    index = Index().geo_haystack('loc', 5).ascending('str1')
+    assert document(index) == {
+        'key' : [('loc', 'geoHaystack'), ('str1', 1)], 'bucketSize' : 5}
+    index = Index().ascending('date').expire(30)
+    assert document(index) == {
+        'key' : [('date', 1)], 'expireAfterSeconds' : 30}
+
+@raises(BadIndexException)
+def test_index_model_drop_dups():
+    # drop_dups is refused by the pymongo versions with IndexModel
+    if not PYMONGO_3:
+        raise BadIndexException()
+    Index().ascending('str1').unique(drop_dups=True)
+
 def expire_index_test():
     import os
     if os.environ.get('FAST_TESTS') == 'true':
@@ -5,7 +5,8 @@ from nose.tools import *
 from mongoalchemy.session import Session
 from mongoalchemy.document import Document, Index, FieldNotRetrieved
 from mongoalchemy.fields import *
-from mongoalchemy.query import BadQueryException, Query, BadResultException
+from mongoalchemy.query import (BadQueryException, Query, BadResultException,
+                                CompiledQuery)
 from test.util import known_failure
 import pymongo
 
@@ -52,6 +53,14 @@ def test_fields_exclude():
     }
     assert expr == expected, q._fields_expression()
 
+def test_fields_order():
+    q = Query(T3, None).fields(T3.mongo_id.exclude())
+    assert q._fields_expression() == { '_id' : False }, q._fields_expression()
+    q = Query(T, None).fields(T.i, T.j, T.i)
+    assert [str(f) for f in q._get_fields()] == ['_id', 'i', 'j', 'i']
+    assert q._fields_expression() == { '_id' : True, 'i' : True, 'j' : True }
+    assert q._get_field_names() == frozenset(['_id', 'i', 'j'])
+
 def test_update():
     s = get_session()
 
@@ -91,6 +100,22 @@ def test_raw_output():
     value = s.query(T).raw_output().one()
     assert isinstance(value, dict)
 
+def test_as_pymongo():
+    s = get_session()
+    s.clear_collection(T)
+    s.save(T(i=3))
+    value = s.query(T).as_pymongo().one()
+    assert isinstance(value, dict)
+    assert value['i'] == 3
+
+def test_values():
+    s = get_session()
+    s.clear_collection(T)
+    s.save(T(i=3, j=4))
+    value = s.query(T).values(T.i).one()
+    assert isinstance(value, dict)
+    assert set(value.keys()) == set(['_id', 'i']), value
+
 def test_limit():
     s = get_session()
     s.clear_collection(T)
@@ -111,6 +136,16 @@ def test_skip():
         pass
     assert count == 0
 
+def test_batch_size():
+    s = get_session()
+    s.clear_collection(T)
+    s.save(T(i=3))
+    s.save(T(i=4))
+    s.save(T(i=5))
+    q = s.query(T).batch_size(1)
+    assert q.clone()._get_batch_size() == 1
+    assert len(q.all()) == 3
+
 def test_hint():
     s = get_session()
     s.clear_collection(T)
@@ -209,6 +244,87 @@ def test_clone():
         pass
     assert count == 1
 
+def test_clone_filter():
+    q = Query(T, None).filter(T.i > 3)
+    q2 = q.clone().filter(T.i < 9)
+    q.filter(T.j == 2)
+    assert q.query == {'i' : {'$gt' : 3}, 'j' : 2}, q.query
+    assert q2.query == {'i' : {'$gt' : 3, '$lt' : 9}}, q2.query
+
+def test_filter_does_not_modify_expression():
+    expr = T.i > 3
+    q = Query(T, None).filter(expr)
+    flat = q.query
+    q.filter(T.i < 9)
+    assert flat == {'i' : {'$gt' : 3}}, flat
+    assert q.query == {'i' : {'$gt' : 3, '$lt' : 9}}, q.query
+    assert Query(T, None).filter(expr).query == {'i' : {'$gt' : 3}}
+
+def test_query_copy():
+    expr = T.i > 3
+    q = Query(T, None).filter(expr)
+    compiled = q.compile()
+    q.query['i']['$lt'] = 0
+    q.query['j'] = 1
+    assert q.query == {'i' : {'$gt' : 3}}, q.query
+    assert compiled.query == {'i' : {'$gt' : 3}}, compiled.query
+    assert Query(T, None).filter(expr).query == {'i' : {'$gt' : 3}}
+
+def test_filter_then_or():
+    expr = (T.i == 3) | (T.i == 4)
+    q = Query(T, None).filter(expr)
+    q.query
+    expr.or_(T.i == 5)
+    want = { '$or' : [{'i' : 3}, {'i' : 4}] }
+    assert q.query == want, q.query
+    assert q.clone().query == want, q.clone().query
+    assert q.compile().query == want, q.compile().query
+
+def test_compile():
+    s = get_session()
+    s.clear_collection(T)
+    s.save(T(i=3))
+    s.save(T(i=4))
+    q = s.query(T).filter(T.i > 3)
+    compiled = q.compile()
+    q.filter(T.j == 1)
+    assert compiled.query == {'i' : {'$gt' : 3}}, compiled.query
+    for _ in range(2):
+        assert [t.i for t in compiled()] == [4]
+    assert q.compile() is not q.compile()
+    assert q.compile().query == {'i' : {'$gt' : 3}, 'j' : 1}
+
+    # changing a compiled query leaves the query alone
+    q.compile().limit = 0
+    q.compile().query['i'] = 3
+    again = q.compile()
+    assert again.limit is None, again.limit
+    assert again.query == {'i' : {'$gt' : 3}, 'j' : 1}, again.query
+
+def test_compile_copy():
+    q = Query(T, None).filter(T.i > 3).fields(T.i, T.l.elem_match({'$gt' : 2}))
+    q.ascending(T.i).hint_asc(T.i).limit(5).skip(1).batch_size(10)
+    before = q.compile()
+
+    compiled = q.compile()
+    compiled.query['i']['$gt'] = 0
+    compiled.query['j'] = 1
+    compiled.fields['i'] = False
+    compiled.fields['l']['$elemMatch']['$gt'] = 0
+    compiled.fields['j'] = True
+    compiled.sort.append(('j', pymongo.DESCENDING))
+    compiled.hints.append(('j', pymongo.ASCENDING))
+    compiled.limit = compiled.skip = compiled.batch_size = 0
+    compiled.raw_output = compiled.no_cache = True
+
+    again = q.compile()
+    for name in CompiledQuery.__slots__:
+        assert getattr(again, name) == getattr(before, name), name
+    assert q.query == {'i' : {'$gt' : 3}}, q.query
+    assert again.fields == {'_id' : True, 'i' : True,
+                            'l' : {'$elemMatch' : {'$gt' : 2}}}, \
+        again.fields
+
 def test_raw_query():
     s = get_session()
     s.clear_collection(T)
@@ -307,6 +423,12 @@ def test_comparators():
     s.query(T).filter(T.i == 1).query == { 'i' : 1}
 
 
+def repeated_operator_test():
+    q = Query(T, None).filter(T.i > 2, T.i < 9).filter(T.i > 3)
+    assert q.query == {'i': {'$gt': 2, '$lt': 9}, '$and': [{'i': {'$gt': 3}}]}, q.query
+    q = Query(T, None).filter(T.i > 2).filter(T.i > 2)
+    assert q.query == {'i': {'$gt': 2}}, q.query
+
 @raises(BadQueryException)
 def invalid_combination_test():
     s = get_session()
@@ -356,6 +478,32 @@ def qr_test_getitem():
     s.save(T(i=4))
     assert s.query(T).descending(T.i)[0].i == 4
 
+def qr_test_getitem_slice():
+    s = get_session()
+    s.clear_collection(T)
+    s.save(T(i=3))
+    s.save(T(i=4))
+    s.save(T(i=5))
+    result = iter(s.query(T).ascending(T.i))[1:3]
+    assert [t.i for t in result] == [4, 5]
+
+def test_query_result_not_cyclic():
+    # dropping a result must free its cursor immediately, not at the next
+    # garbage collection
+    import gc
+    from mongoalchemy.query import QueryResult
+    freed = []
+    class Cursor(object):
+        def __del__(self):
+            freed.append(True)
+    gc.disable()
+    try:
+        result = QueryResult(None, Cursor(), T)
+        del result
+        assert freed
+    finally:
+        gc.enable()
+
 def qr_test_rewind():
     s = get_session()
     s.clear_collection(T)
@@ -372,6 +520,14 @@ def qr_test_rewind():
     except StopIteration:
         pass
 
+def qr_test_batch_size():
+    s = get_session()
+    s.clear_collection(T)
+    s.save(T(i=3))
+    s.save(T(i=4))
+    it = iter(s.query(T)).batch_size(1)
+    assert len(list(it)) == 2
+
 def qr_test_clone():
     s = get_session()
     s.clear_collection(T)
@@ -1,12 +1,16 @@
 from __future__ import print_function
 from mongoalchemy.py3compat import *
 
+import gc
+import re
+import weakref
 from nose.tools import *
 from mongoalchemy.session import Session
 from mongoalchemy.document import Document, Index, FieldNotRetrieved
 from mongoalchemy.fields import *
 from mongoalchemy.query import BadQueryException, Query, BadResultException
-from mongoalchemy.query_expression import Q
+from mongoalchemy.query_expression import (Q, QueryExpression, _escape,
+                                           _free_form_fields)
 from test.util import known_failure
 
 
@@ -204,6 +208,24 @@ def test_geo_haystack():
 #
 #  Regex Tests
 #
+def test_regex_escaping():
+    # re.escape differs between python versions for non-alphanumeric
+    # characters, so check that the escaped text matches itself literally
+    for text in ['abra', 'wingardium_leviosa2', u'caf\xe9',
+                 'ab.*ra', '(a|b)', '[x]{2}?', 'a+b^c$', 'a-b\\c',
+                 'a&b~c', 'a#b', 'a b', 'a\tb\nc']:
+        assert re.match('^' + _escape(text) + '$', text), text
+        assert not re.match('^' + _escape(text) + '$', text + 'x'), text
+        start = Q.name.startswith(text).obj[Q.name]['$regex']
+        assert re.match(start, text + 'xyz'), text
+        assert not re.match(start, 'x' + text), text
+        end = Q.name.endswith(text).obj[Q.name]['$regex']
+        assert re.search(end, 'xyz' + text), text
+        assert not re.search(end, text + 'x'), text
+    assert _escape('') == '' and _escape('abra') == 'abra'
+    assert Query(Q, None).filter(Q.name.startswith('a.b')).query == {
+        'name' : {'$regex' : '^a\\.b'}}
+
 def test_regex():
     class Spell(Document):
         name = StringField()
@@ -290,6 +312,42 @@ def test_or():
 
     assert Query(T, None).or_(T.i == 3, T.i == 4, T.i == 5).query == want
 
+def test_free_form_shared():
+    assert Q.foo is Q.foo
+    # fields are only shared while something still refers to them
+    Q.not_kept
+    gc.collect()
+    assert 'not_kept' not in _free_form_fields
+    foo = Q.foo
+    child = weakref.ref(foo.not_kept)
+    gc.collect()
+    assert child() is None
+    assert Q.foo.bar is Q.foo.bar
+    assert Q.foo.bar.baz.get_absolute_name() == 'foo.bar.baz'
+    # configuring a shared field still leaves it untouched
+    assert Q.foo.elem_match({'bar' : 1}) is not Q.foo
+    assert Q.foo.fields_expression is True
+
+def test_or_nested():
+    want = { '$or' : [{'i' : 3}, {'i' : 4}, {'i' : 5}] }
+    q = Query(T, None).filter((T.i == 3) | ((T.i == 4) | (T.i == 5)))
+    assert q.query == want, q.query
+    q = Query(T, None).or_(T.i == 3, (T.i == 4) | (T.i == 5))
+    assert q.query == want, q.query
+
+    # an $or alongside other conditions is one clause, not a list to extend
+    both = QueryExpression({'$or' : [{T.i : 3}, {T.i : 4}], T.j : 1})
+    q = Query(T, None).or_(both, T.i == 5)
+    assert q.query == { '$or' : [{'$or' : [{'i' : 3}, {'i' : 4}], 'j' : 1},
+                                 {'i' : 5}] }, q.query
+
+def test_or_in_place():
+    expr = T.i == 3
+    assert expr.or_(T.i == 4) is expr
+    expr.or_((T.i == 5) | (T.i == 6))
+    q = Query(T, None).filter(expr)
+    assert q.query == { '$or' : [{'i' : 3}, {'i' : 4}, {'i' : 5}, {'i' : 6}] }, q.query
+
 def test_in():
     q = Query(T, None)
     assert q.in_(T.i, 1, 2, 3).query == {'i' : {'$in' : [1,2,3]}}, q.in_(T.i, 1, 2, 3).query
@@ -303,7 +361,11 @@ def test_nin():
 def test_exists():
     q = Query(T, None)
     assert q.filter(T.i.exists(False)).query == {'i': {'$exists': False}}
-    assert q.filter(T.i.exists(True)).query == {'i': {'$exists': True}}
+    # a conflicting $exists on the same field is and-ed, not overwritten
+    assert q.filter(T.i.exists(True)).query == {
+        'i': {'$exists': False},
+        '$and': [{'i': {'$exists': True}}],
+    }, q.query
 
 
 # free-form queries
@@ -325,3 +387,12 @@ def test_ffq():
 def test_array_index_operator():
     assert str(NestedParent.l.matched_index().i) == 'l.$.i', NestedParent.l.matched_index().i
 
+def test_shared_query_field_not_modified():
+    assert T.i is T.i
+    assert str(NestedParent.l.matched_index().i) == 'l.$.i'
+    assert str(NestedParent.l.i) == 'l.i'
+    T3.t_list.elem_match({'i': 1})
+    assert T3.t_list.fields_expression is True
+    T.i.exclude()
+    assert T.i.fields_expression is True
+
@@ -126,6 +126,25 @@ def test_cache3():
     assert id(t) == id(t2)
     assert id(s.refresh(t)) != t2
 
+def test_no_cache():
+    s_other = Session.connect('unit-testing')
+    t = TExtra(i=4)
+    s_other.save(t)
+
+    s = Session.connect('unit-testing', cache_size=10)
+    for t2 in s.query(TExtra).filter_by(mongo_id=t.mongo_id).iterator():
+        assert t2.mongo_id == t.mongo_id
+    assert s.cache == {}
+    s.query(TExtra).filter_by(mongo_id=t.mongo_id).no_cache().one()
+    assert s.cache == {}
+
+    # iterator() leaves caching on for later uses of the query
+    q = s.query(TExtra).filter_by(mongo_id=t.mongo_id)
+    list(q.iterator())
+    assert s.cache == {}
+    q.one()
+    assert t.mongo_id in s.cache
+
 # def test_cache2():
 #     class SimpleDoc(Document):
 #         i = IntField()
@@ -430,3 +449,24 @@ def test_auto_ensure_indexes():
     assert "_id_" in indexes
     assert "i_1" in indexes
 
+
+def test_auto_ensure_indexes_once():
+    s = Session.connect('unit-testing', auto_ensure=True)
+    s.db.drop_collection(TUnique.get_collection_name())
+    ensured = []
+    ensure_indexes = s.ensure_indexes
+    def counting_ensure(cls):
+        ensured.append(cls)
+        ensure_indexes(cls)
+    s.ensure_indexes = counting_ensure
+
+    # only the first use of the type ensures indexes
+    s.query(TUnique).all()
+    s.query(TUnique).all()
+    assert ensured == [TUnique], ensured
+    assert TUnique in s.ensured_types
+    assert "i_1" in s.get_indexes(TUnique)
+
+    # clearing the collection forgets that they were ensured
+    s.clear_collection(TUnique)
+    assert TUnique not in s.ensured_types
@@ -21,6 +21,7 @@ class T(Document):
 
 class T2(Document):
     t = DocumentField(T)
+    l = ListField(DocumentField(T), required=False)
 
 class TUnique(Document):
     i = IntField()
@@ -326,7 +327,15 @@ def append_db_test():
 def extend_test():
     q = update_test_setup()
     assert q.extend(T.l, *(1, 2, 3)).update_data == {
-        '$pushAll' : { 'l' : (1, 2, 3) }
+        '$pushAll' : { 'l' : [1, 2, 3] }
+    }
+
+def extend_wraps_test():
+    s = get_session()
+    q = s.query(T2)
+    t = T(i=3)
+    assert q.extend(T2.l, t).update_data == {
+        '$pushAll' : { 'l' : [t.wrap()] }
     }
 
 def extend_db_test():
@@ -375,7 +384,7 @@ def remove_db_test():
 def remove_all_test():
     q = update_test_setup()
     assert q.remove_all(T.l, *(1, 2, 3)).update_data == {
-        '$pullAll' : { 'l' : (1, 2, 3) }
+        '$pullAll' : { 'l' : [1, 2, 3] }
     }
 
 @raises(InvalidModifierException)